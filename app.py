@@ -1,14 +1,15 @@
 from flask import Flask, request, jsonify, Response, send_from_directory
 from flask_cors import CORS
 import numpy as np
-from scipy.signal import butter, filtfilt
 import pandas as pd
 from scipy.fft import fft, fftfreq
 import os
 import glob
 import json
+import math
 import time
 from scipy import signal
+from utils.dsp import butter_filter, butter_filter_batch, moving_rms
 
 app = Flask(__name__)
 CORS(app)  # Allow all origins for development
@@ -27,15 +28,6 @@ def load_data(file_name):
     fs = 1.0 / np.mean(np.diff(t))
     return t, theta, fs
 
-def butter_filter(data, cutoff, fs, btype, order=4):
-    nyq = 0.5 * fs
-    norm_cutoff = cutoff / nyq
-    b, a = butter(order, norm_cutoff, btype=btype)
-    return filtfilt(b, a, data)
-
-def moving_rms(x, window_samples):
-    return np.sqrt(np.convolve(x**2, np.ones(window_samples)/window_samples, mode='same'))
-
 def load_processed_data(file_name, feature='centeredTorque'):
     """Load processed data file and return time and requested feature"""
     try:
@@ -81,13 +73,32 @@ def load_processed_data(file_name, feature='centeredTorque'):
         print(f"Error loading processed data {file_name}: {e}")
         return None, None
 
+def parse_finite_params(params, defaults):
+    """Coerce params named in defaults to finite floats, raising ValueError on bad input"""
+    values = {}
+    for name, default in defaults.items():
+        value = params.get(name, default)
+        # float(True) would silently become 1.0
+        if isinstance(value, bool):
+            raise ValueError(f"{name} must be numeric, not a boolean")
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be numeric")
+        # NaN/inf would reach the device as NaN torque (and invalid JSON)
+        if not math.isfinite(value):
+            raise ValueError(f"{name} must be finite")
+        values[name] = value
+    return values
+
 # Global variables to store current data and streaming state
 current_data = {
     'data': None,
     'parameters': None,
     'selected_feature': None,
     'is_streaming': False,
-    'current_index': 0
+    'current_index': 0,
+    'gains': None
 }
 
 @app.route('/')
@@ -113,8 +124,9 @@ def process_signal():
     low_cut = 1.5   # Hz
     high_cut = 3.0  # Hz
     theta_centered = theta - np.mean(theta)
-    theta_base_centered = butter_filter(theta_centered, low_cut, fs, 'low')
-    tremor_comp = butter_filter(theta, high_cut, fs, 'high')
+    # Raw and centered angle share each design, so filter them as one batch
+    theta_base_centered, theta_base_raw = butter_filter_batch(np.stack([theta_centered, theta]), low_cut, fs, 'low')
+    tremor_comp, tremor_comp_centered = butter_filter_batch(np.stack([theta, theta_centered]), high_cut, fs, 'high')
     
     # Derivatives
     theta_dot = np.gradient(theta, 1/fs)
@@ -132,7 +144,6 @@ def process_signal():
     G = params.get('G', 1.0)  # Global gain
     
     # Raw base angle and derivatives for File Data Plot
-    theta_base_raw = butter_filter(theta, low_cut, fs, 'low')
     theta_dot_raw = np.gradient(theta, 1/fs)
     theta_base_dot_raw = np.gradient(theta_base_raw, 1/fs)
 
@@ -141,7 +152,6 @@ def process_signal():
     tau_total_raw = G * (theta_base_raw + alpha * envelope * tremor_comp)
 
     # Centered version for comparison
-    tremor_comp_centered = butter_filter(theta_centered, high_cut, fs, 'high')
     envelope_centered = moving_rms(tremor_comp_centered, window_samples)
     env_tremor_centered = envelope_centered * tremor_comp_centered
     
@@ -224,13 +234,20 @@ def start_live_stream():
         
         if not filename:
             return jsonify({'error': 'No filename provided'}), 400
+        
+        # Validate gains up front; live_data evaluates torque with them per frame
+        try:
+            gain_params = parse_finite_params(params, {'alpha': 1.0, 'G': 1.0})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
             
         # Load and process data
         data = pd.read_csv(os.path.join(DATA_DIR, filename))
         
         # Determine sampling frequency from time data
-        if 'time' in data.columns:
-            time = data['time'].values
+        time_col = 'time' if 'time' in data.columns else 'Time (s)'
+        if time_col in data.columns:
+            time = data[time_col].values
             # Calculate fs from time differences
             time_diffs = np.diff(time)
             fs = 1.0 / np.mean(time_diffs)  # Average sampling frequency
@@ -245,34 +262,39 @@ def start_live_stream():
         
         # Extract data within the time range
         time = time[start_idx:end_idx]
-        theta = data['theta'].values[start_idx:end_idx]
-        theta_dot = data['theta_dot'].values[start_idx:end_idx]
+        # Original recordings store the wrist angle as WFE_angle
+        theta_col = 'theta' if 'theta' in data.columns else 'WFE_angle'
+        theta = data[theta_col].values[start_idx:end_idx]
+        if 'theta_dot' in data.columns:
+            theta_dot = data['theta_dot'].values[start_idx:end_idx]
+        else:
+            theta_dot = np.gradient(theta, 1/fs)
         
         # Signal decomposition
         f, Pxx = signal.welch(theta, fs, nperseg=1024)
         tremor_freq = f[np.argmax(Pxx[1:]) + 1]  # Skip DC component
         
         # Extract tremor component
-        b, a = signal.butter(4, [tremor_freq-0.5, tremor_freq+0.5], btype='band', fs=fs)
-        tremor = signal.filtfilt(b, a, theta)
+        tremor = butter_filter(theta, [tremor_freq-0.5, tremor_freq+0.5], fs, 'band')
         
         # Calculate envelope
         analytic_signal = signal.hilbert(tremor)
         envelope = np.abs(analytic_signal)
         
         # Filtered angle (low-pass filtered)
-        b_low, a_low = signal.butter(4, 1.0, btype='low', fs=fs)
-        filtered_theta = signal.filtfilt(b_low, a_low, theta)
+        filtered_theta = butter_filter(theta, 1.0, fs, 'low')
         
         # Calculate torque for all points
         Kp = params.get('Kp', 1.0)
         Kd = params.get('Kd', 1.0)
-        alpha = params.get('alpha', 1.0)
-        G = params.get('G', 1.0)
+        alpha = gain_params['alpha']
+        G = gain_params['G']
         
         # Direct Torque Output - Hybrid Replay
         # τ = G × (θ_base + α × A × T_raw)
-        tau_total = G * (filtered_theta + alpha * envelope * tremor)
+        # Torque is evaluated per frame in live_data from the retained
+        # components so alpha/G can be changed while streaming
+        env_tremor = envelope * tremor
         
         # Store processed data
         current_data['data'] = {
@@ -280,11 +302,18 @@ def start_live_stream():
             'rawAngle': theta,
             'filteredAngle': filtered_theta,
             'angularVelocity': theta_dot,
-            'torque': tau_total,
+            'envTremor': env_tremor,
             'tremor': tremor,
             'envelope': envelope
         }
         current_data['parameters'] = params
+        current_data['gains'] = {
+            'alpha': alpha,
+            'G': G,
+            'target_alpha': alpha,
+            'target_G': G,
+            'ramp_remaining': 0
+        }
         current_data['selected_feature'] = selected_feature
         current_data['is_streaming'] = True
         current_data['current_index'] = 0
@@ -304,6 +333,56 @@ def stop_live_stream():
     current_data['is_streaming'] = False
     return jsonify({'message': 'Live stream stopped successfully'})
 
+@app.route('/api/update-live-stream', methods=['POST'])
+def update_live_stream():
+    """Hot-swap alpha and G on the running live stream without reprocessing"""
+    global current_data
+    
+    if not current_data['is_streaming'] or current_data['gains'] is None:
+        return jsonify({'error': 'No active live stream'}), 400
+    
+    # An empty body keeps the current gains; anything else must be a JSON object
+    params = request.get_json(silent=True)
+    if params is None and not request.get_data():
+        params = {}
+    if not isinstance(params, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    
+    gains = current_data['gains']
+    try:
+        values = parse_finite_params(params, {
+            'alpha': gains['target_alpha'],
+            'G': gains['target_G'],
+            'smoothingMs': 0
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    target_alpha = values['alpha']
+    target_G = values['G']
+    smoothing_ms = values['smoothingMs']
+    
+    if smoothing_ms < 0:
+        return jsonify({'error': 'smoothingMs must be non-negative'}), 400
+    
+    # Ramp linearly over smoothingMs so the device never sees a torque step;
+    # smoothingMs = 0 applies the new gains at the next frame
+    ramp_samples = int(round(smoothing_ms / 1000 * current_data['fs']))
+    current_data['gains'] = {
+        'alpha': target_alpha if ramp_samples == 0 else gains['alpha'],
+        'G': target_G if ramp_samples == 0 else gains['G'],
+        'target_alpha': target_alpha,
+        'target_G': target_G,
+        'ramp_remaining': ramp_samples
+    }
+    current_data['parameters'] = {**current_data['parameters'], 'alpha': target_alpha, 'G': target_G}
+    
+    return jsonify({
+        'message': 'Live stream parameters updated',
+        'alpha': target_alpha,
+        'G': target_G,
+        'rampSamples': ramp_samples
+    })
+
 @app.route('/api/live-data')
 def live_data():
     def generate():
@@ -314,16 +393,27 @@ def live_data():
                 break
                 
             # Get current data point
-            time = current_data['data']['time'][current_data['current_index']]
+            sample_time = current_data['data']['time'][current_data['current_index']]
             selected_feature = current_data['selected_feature']
             
+            # Step any pending gain ramp towards its target
+            gains = current_data['gains']
+            if gains['ramp_remaining'] > 0:
+                gains['alpha'] += (gains['target_alpha'] - gains['alpha']) / gains['ramp_remaining']
+                gains['G'] += (gains['target_G'] - gains['G']) / gains['ramp_remaining']
+                gains['ramp_remaining'] -= 1
+            
+            # τ = G × (θ_base + α × A × T_raw) with the current gains
+            torque = gains['G'] * (current_data['data']['filteredAngle'][current_data['current_index']] +
+                                   gains['alpha'] * current_data['data']['envTremor'][current_data['current_index']])
+            
             # Create data point with all features (for recording)
             data_point = {
-                'time': float(time),
+                'time': float(sample_time),
                 'rawAngle': float(current_data['data']['rawAngle'][current_data['current_index']]),
                 'filteredAngle': float(current_data['data']['filteredAngle'][current_data['current_index']]),
                 'angularVelocity': float(current_data['data']['angularVelocity'][current_data['current_index']]),
-                'torque': float(current_data['data']['torque'][current_data['current_index']]),
+                'torque': float(torque),
                 'tremor': float(current_data['data']['tremor'][current_data['current_index']]),
                 'envelope': float(current_data['data']['envelope'][current_data['current_index']])
             }
@@ -0,0 +1,82 @@
+"""
+Shared DSP core for app.py and the utils scripts.
+
+Butterworth designs are memoized per (order, cutoff, fs, btype) in
+second-order-sections form, which stays numerically stable at high orders
+and narrow bands where the (b, a) transfer-function form breaks down.
+"""
+from functools import lru_cache
+import numpy as np
+from scipy.signal import butter, sosfilt, sosfiltfilt
+
+
+@lru_cache(maxsize=256)
+def _butter_sos(order, cutoff, fs, btype):
+    return butter(order, cutoff, btype=btype, fs=fs, output='sos')
+
+
+def butter_sos(order, cutoff, fs, btype):
+    """Return a copy of the cached Butterworth design as second-order sections.
+
+    cutoff is in Hz; pass a (low, high) pair for 'band'/'bandstop'. A copy is
+    returned because sosfilt rejects read-only arrays, and an in-place edit by
+    one caller must not corrupt the cached design.
+    """
+    if np.ndim(cutoff):
+        cutoff = tuple(float(c) for c in cutoff)
+    else:
+        cutoff = float(cutoff)
+    return _butter_sos(int(order), cutoff, float(fs), btype).copy()
+
+
+def butter_filter(data, cutoff, fs, btype, order=4, axis=-1, zero_phase=True):
+    """Butterworth filter along axis; zero-phase (sosfiltfilt) by default, causal (sosfilt) otherwise."""
+    sos = butter_sos(order, cutoff, fs, btype)
+    if zero_phase:
+        return sosfiltfilt(sos, data, axis=axis)
+    return sosfilt(sos, data, axis=axis)
+
+
+def butter_filter_batch(signals, cutoff, fs, btype, order=4, zero_phase=True):
+    """Filter many signals or recordings in one call.
+
+    signals is a 2-D array (one signal per row) or a sequence of 1-D arrays
+    of any lengths; fs is a single rate or one per signal. Signals sharing
+    a length and rate are stacked and filtered together with one cached
+    design. Returns a 2-D array for 2-D array input, otherwise a list in
+    input order. Raises ValueError for arrays of any other dimensionality.
+    """
+    if isinstance(signals, np.ndarray):
+        if signals.ndim == 1:
+            raise ValueError("Expected a 2-D array of signals, got 1-D; "
+                             "use butter_filter for a single signal")
+        if signals.ndim != 2:
+            raise ValueError(f"Expected a 2-D array of signals, got {signals.ndim}-D")
+        if np.ndim(fs) == 0:
+            return butter_filter(signals, cutoff, fs, btype, order=order, axis=-1, zero_phase=zero_phase)
+        return np.stack(butter_filter_batch(list(signals), cutoff, fs, btype,
+                                            order=order, zero_phase=zero_phase))
+
+    signals = [np.asarray(x) for x in signals]
+    for i, x in enumerate(signals):
+        if x.ndim != 1:
+            raise ValueError(f"Signal {i} is {x.ndim}-D; expected 1-D arrays")
+    rates = [fs] * len(signals) if np.ndim(fs) == 0 else list(fs)
+    if len(rates) != len(signals):
+        raise ValueError(f"Got {len(rates)} sampling rates for {len(signals)} signals")
+
+    groups = {}
+    for i, (x, rate) in enumerate(zip(signals, rates)):
+        groups.setdefault((len(x), float(rate)), []).append(i)
+
+    filtered = [None] * len(signals)
+    for (_, rate), indices in groups.items():
+        stacked = np.stack([signals[i] for i in indices])
+        out = butter_filter(stacked, cutoff, rate, btype, order=order, axis=-1, zero_phase=zero_phase)
+        for i, row in zip(indices, out):
+            filtered[i] = row
+    return filtered
+
+
+def moving_rms(x, window_samples):
+    return np.sqrt(np.convolve(x**2, np.ones(window_samples)/window_samples, mode='same'))
@@ -1,18 +1,10 @@
-import os, glob, json
+import os, sys, glob, json
 import pandas as pd
 import numpy as np
-from scipy.signal import butter, filtfilt
 
-def butter_filter(data, cutoff, fs, btype, order=4):
-    nyq = 0.5 * fs
-    norm_cutoff = cutoff / nyq
-    b, a = butter(order, norm_cutoff, btype=btype)
-    return filtfilt(b, a, data)
-
-def moving_rms(x, window_samples):
-    return np.sqrt(np.convolve(x**2,
-                               np.ones(window_samples)/window_samples,
-                               mode='same'))
+# Import the shared DSP core the same way app.py does, from any working directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.dsp import butter_filter, moving_rms
 
 # === Config ===
 INPUT_DIR   = '/Users/jimzhu/work_dir/Imperial/FYP/engineering_platform/data/original'
@@ -0,0 +1,464 @@
+"""
+Headless replay harness for the haptic streaming paths.
+
+Starts the Flask backend in-process together with a simulated ESP32 that
+speaks the same WebSocket command protocol as esp32_haptic_client (port 81),
+replays every case-study recording over:
+
+  ws  - Case Studies path: /api/file-data, then batched WebSocket sends
+        paced exactly like useCaseStudiesWebSocket.js
+  sse - /api/start-live-stream -> /api/live-data, each torque sample relayed
+        to the device as soon as it arrives
+
+and reports per-run throughput, inter-arrival jitter percentiles, gaps and
+drift against the nominal fs. The firmware's hapticTask writes buffered
+samples to the DAC as soon as they arrive, so arrival timing is the device's
+output timing. Underruns of a hypothetical consumer draining at a fixed fs
+are reported separately as `fixed_rate_model`; the real device has no such
+consumer.
+
+Usage:
+    python utils/stream_harness.py --paths ws sse --duration 5 --json report.json
+    python utils/stream_harness.py --max-jitter-p99-ms 60 --max-gaps 0 --max-timeouts 0
+    python utils/stream_harness.py --paths ws --max-drift-ms 150
+
+The current tree passes the last two gates at the default 5 s duration. Drift
+grows with duration. ws runs ~1-2% fast because the hook rounds its batch
+interval down to whole ms (50-100 ms over 5 s). sse runs ~18-26% slow because
+live_data sleeps 1/fs after every sample (0.9-1.3 s over 5 s), so sse is
+expected to fail any --max-drift-ms gate until that pacing is fixed.
+
+Exits non-zero when a run fails or a --max-* threshold is exceeded.
+"""
+import os, sys, json, time, argparse, logging, threading
+import numpy as np
+import requests
+from werkzeug.serving import make_server
+from websockets.sync.server import serve
+from websockets.sync.client import connect
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# === Config (mirrors the firmware and the frontend streaming hooks) ===
+DEVICE_PORT        = 81      # WebSocketsServer(81) in esp32_haptic_client.ino
+BACKEND_PORT       = 5001    # app.run(..., port=5001)
+BUFFER_SIZE        = 4096    # device ring buffer
+DATA_TIMEOUT_S     = 1.0     # device stops the motor after 1 s without data
+TARGET_INTERVAL_MS = 50      # frontend batch interval (20 Hz update rate)
+MIN_INTERVAL_MS    = 16      # frontend minimum interval
+GAP_MS             = 100     # inter-arrival above this counts as a gap
+PERCENTILES        = (50, 90, 99)
+
+
+class SimulatedHapticDevice:
+    """WebSocket server mimicking esp32_haptic_client's command protocol.
+
+    Like processCommand, only text frames are parsed, and every JSON message
+    carrying `value` is buffered and timestamped whatever the streaming state
+    (including alongside a command). `startStreaming` resets the recording,
+    like the firmware resets its buffer.
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEVICE_PORT):
+        self.host = host
+        self.port = port
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.is_streaming = False
+        self.is_manual_control = False
+        self.sampling_rate = None
+        self.arrivals = []
+        self.values = []
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def start(self):
+        self._server = serve(self._handle_client, self.host, self.port)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._server = None
+
+    def take_session(self):
+        """Return (arrivals, values, sampling_rate) of the last streaming session."""
+        with self._lock:
+            return np.array(self.arrivals), np.array(self.values), self.sampling_rate
+
+    def _handle_client(self, ws):
+        last_stats = time.perf_counter()
+        message_count = 0
+        for message in ws:
+            now = time.perf_counter()
+            # webSocketEvent only handles WStype_TEXT; binary frames are ignored
+            if isinstance(message, bytes):
+                continue
+
+            try:
+                doc = json.loads(message)
+            except ValueError:
+                continue
+            if not isinstance(doc, dict):
+                continue
+
+            command = doc.get('command')
+            if command == 'startStreaming':
+                with self._lock:
+                    self.is_streaming = True
+                    self.is_manual_control = False
+                    self.sampling_rate = doc.get('samplingRate')
+                    self.arrivals = []
+                    self.values = []
+                message_count = 0
+                ws.send(json.dumps({'type': 'status', 'message': 'Streaming started'}))
+            elif command == 'stopStreaming':
+                with self._lock:
+                    self.is_streaming = False
+                ws.send(json.dumps({'type': 'status', 'message': 'Streaming stopped'}))
+            elif command == 'startManualControl':
+                with self._lock:
+                    self.is_manual_control = True
+                    self.is_streaming = False
+                ws.send(json.dumps({'type': 'status', 'message': 'Manual control started'}))
+            elif command == 'stopManualControl':
+                with self._lock:
+                    self.is_manual_control = False
+                ws.send(json.dumps({'type': 'status', 'message': 'Manual control stopped'}))
+            elif command == 'ping':
+                ws.send(json.dumps({'type': 'pong'}))
+
+            if 'value' in doc:
+                value = doc['value']
+                # ArduinoJson reads non-numeric values as 0
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    value = 0.0
+                with self._lock:
+                    self.arrivals.append(now)
+                    self.values.append(float(value))
+                message_count += 1
+
+            if self.is_streaming and now - last_stats >= 1.0:
+                ws.send(json.dumps({'type': 'performance', 'messageRate': message_count}))
+                message_count = 0
+                last_stats = now
+
+
+class BackendServer:
+    """Runs the Flask app from app.py on a background thread."""
+
+    def __init__(self, host='127.0.0.1', port=BACKEND_PORT):
+        from app import app
+        # Keep per-request access logs out of the report
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self.host = host
+        self.port = port
+        self._server = make_server(host, port, app, threaded=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._thread.join()
+
+
+def _percentiles(x):
+    stats = {f"p{p}": float(np.percentile(x, p)) for p in PERCENTILES}
+    stats['max'] = float(np.max(x))
+    return stats
+
+
+def simulate_fixed_rate_playback(arrivals, fs):
+    """Drain a 4096-sample buffer at a fixed fs starting at the first arrival.
+
+    This is a hypothetical consumer, not the firmware (which writes samples
+    out as fast as they arrive); it shows how the stream would fare on a
+    hardware-timer playback. Returns (underruns, dropped, peak_buffer).
+    """
+    n = len(arrivals)
+    period = 1.0 / fs
+    tick = arrivals[0]
+    available = played = 0
+    underruns = dropped = peak_buffer = 0
+    while played + dropped < n:
+        while available < n and arrivals[available] <= tick:
+            available += 1
+        buffered = available - played - dropped
+        if buffered > BUFFER_SIZE:
+            dropped += buffered - BUFFER_SIZE
+            buffered = BUFFER_SIZE
+        peak_buffer = max(peak_buffer, buffered)
+        if buffered > 0:
+            played += 1
+        else:
+            underruns += 1
+        tick += period
+    return underruns, dropped, peak_buffer
+
+
+def summarize_arrivals(arrivals, fs, expected_samples=None, gap_ms=GAP_MS):
+    """Throughput, jitter, gaps and drift of per-sample arrival timestamps."""
+    n = len(arrivals)
+    summary = {'samples': n, 'expected_samples': expected_samples, 'nominal_fs': float(fs)}
+    if n < 2:
+        return summary
+
+    dt = np.diff(arrivals)
+    nominal_dt = 1.0 / fs
+    elapsed = arrivals[-1] - arrivals[0]
+    drift = arrivals - (arrivals[0] + np.arange(n) * nominal_dt)
+    underruns, dropped, peak_buffer = simulate_fixed_rate_playback(arrivals, fs)
+
+    summary.update({
+        'duration_s': float(elapsed),
+        'throughput_hz': float((n - 1) / elapsed) if elapsed > 0 else float('inf'),
+        'inter_arrival_ms': _percentiles(dt * 1000),
+        'jitter_ms': _percentiles(np.abs(dt - nominal_dt) * 1000),
+        'gaps': int(np.sum(dt > gap_ms / 1000)),
+        'max_gap_ms': float(np.max(dt) * 1000),
+        'timeouts': int(np.sum(dt > DATA_TIMEOUT_S)),
+        'drift_ms': float(drift[-1] * 1000),
+        'max_abs_drift_ms': float(np.max(np.abs(drift)) * 1000),
+        'drift_ppm': float((elapsed / ((n - 1) * nominal_dt) - 1) * 1e6),
+        'fixed_rate_model': {
+            'underruns': underruns,
+            'dropped': dropped,
+            'peak_buffer': peak_buffer,
+        },
+    })
+    return summary
+
+
+def _stop_device_stream(ws, timeout=10.0):
+    """Send stopStreaming and wait for the ack so every sample is recorded."""
+    ws.send(json.dumps({'command': 'stopStreaming'}))
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        reply = json.loads(ws.recv(timeout=deadline - time.monotonic()))
+        if reply.get('type') == 'status' and reply.get('message') == 'Streaming stopped':
+            return
+    raise TimeoutError('Device did not acknowledge stopStreaming')
+
+
+def replay_websocket(device_url, case_id, time_data, feature_data, duration=None):
+    """Replay one case over WebSocket, paced like useCaseStudiesWebSocket.js.
+
+    Returns (sampling_rate, samples_sent).
+    """
+    sampling_rate = round(1 / (time_data[1] - time_data[0]))
+    points_per_batch = max(1, int(sampling_rate * TARGET_INTERVAL_MS / 1000))
+    interval = max(MIN_INTERVAL_MS, int(1000 * points_per_batch / sampling_rate)) / 1000
+    n = len(time_data) if duration is None else min(len(time_data), int(duration * sampling_rate))
+
+    with connect(device_url) as ws:
+        ws.send(json.dumps({'command': 'startStreaming', 'case_id': case_id,
+                            'samplingRate': sampling_rate}))
+        index = 0
+        next_tick = time.perf_counter() + interval
+        while index < n:
+            # setInterval semantics: late ticks are not made up with bursts
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_tick = max(next_tick + interval, time.perf_counter())
+            for _ in range(points_per_batch):
+                if index >= n:
+                    break
+                ws.send(json.dumps({'time': float(time_data[index]),
+                                    'value': float(feature_data[index])}))
+                index += 1
+        _stop_device_stream(ws)
+    return sampling_rate, n
+
+
+def replay_sse(backend_url, device_url, filename, duration=None):
+    """Replay one recording through /api/live-data and relay torque to the device.
+
+    Returns (fs, samples_relayed).
+    """
+    # endTime defaults to 10 s in start_live_stream; 1e9 s covers any recording
+    end_time = duration if duration is not None else 1e9
+    relayed = 0
+    try:
+        resp = requests.post(f"{backend_url}/api/start-live-stream", json={
+            'filename': filename,
+            'startTime': 0,
+            'endTime': end_time,
+            'selectedFeature': 'torque'
+        })
+        resp.raise_for_status()
+        fs = resp.json()['fs']
+
+        with connect(device_url) as ws:
+            ws.send(json.dumps({'command': 'startStreaming', 'samplingRate': round(fs)}))
+            with requests.get(f"{backend_url}/api/live-data", stream=True) as stream:
+                for line in stream.iter_lines(chunk_size=None):
+                    if not line.startswith(b'data: '):
+                        continue
+                    point = json.loads(line[len(b'data: '):])
+                    ws.send(json.dumps({'time': point['time'], 'value': point['torque']}))
+                    relayed += 1
+            _stop_device_stream(ws)
+    finally:
+        # Always leave the backend idle so the next recording starts clean
+        requests.post(f"{backend_url}/api/stop-live-stream")
+    return fs, relayed
+
+
+def load_case_recordings(backend_url):
+    """Map each distinct case-study recording to the cases that use it."""
+    config = requests.get(f"{backend_url}/api/case-studies-config").json()
+    recordings = {}
+    for case_id, entry in sorted(config.items()):
+        if isinstance(entry, dict) and entry.get('file'):
+            key = (entry['file'], entry.get('feature', 'centeredTorque'))
+            recordings.setdefault(key, []).append(case_id)
+    return recordings
+
+
+def run_harness(backend_url, device, paths, duration=None):
+    """Replay every case-study recording over each path and collect reports."""
+    reports = []
+    recordings = load_case_recordings(backend_url)
+    original_files = set(requests.get(f"{backend_url}/api/list-files").json()['files'])
+
+    for (filename, feature), case_ids in recordings.items():
+        for path in paths:
+            report = {'path': path, 'cases': case_ids, 'file': filename}
+            try:
+                if path == 'ws':
+                    resp = requests.get(f"{backend_url}/api/file-data",
+                                        params={'filename': filename, 'feature': feature})
+                    resp.raise_for_status()
+                    payload = resp.json()
+                    fs, sent = replay_websocket(device.url, case_ids[0], payload['time'],
+                                                payload['featureData'], duration)
+                else:
+                    # Processed files are named "<recording>_G..._all_signals_<ts>.csv"
+                    recording = filename.split('_G')[0] + '.csv'
+                    if recording not in original_files:
+                        report['error'] = f"No original recording {recording}"
+                        reports.append(report)
+                        continue
+                    report['file'] = recording
+                    fs, sent = replay_sse(backend_url, device.url, recording, duration)
+                arrivals, _, _ = device.take_session()
+                report.update(summarize_arrivals(arrivals, fs, expected_samples=sent))
+            except Exception as e:
+                report['error'] = str(e)
+            reports.append(report)
+            print(format_report(report))
+    return reports
+
+
+def format_report(report):
+    name = f"[{report['path']:3s}] {', '.join(report['cases'])}"
+    if 'error' in report:
+        return f"{name}\n  ERROR: {report['error']}"
+    if 'jitter_ms' not in report:
+        return f"{name}\n  samples={report['samples']} (too few to analyse)"
+    jitter = report['jitter_ms']
+    model = report['fixed_rate_model']
+    return (f"{name}\n"
+            f"  samples={report['samples']}/{report['expected_samples']} "
+            f"fs={report['nominal_fs']:.1f} Hz throughput={report['throughput_hz']:.1f} Hz\n"
+            f"  jitter p50={jitter['p50']:.3f} p90={jitter['p90']:.3f} "
+            f"p99={jitter['p99']:.3f} max={jitter['max']:.3f} ms\n"
+            f"  gaps={report['gaps']} (max {report['max_gap_ms']:.1f} ms) "
+            f"drift={report['drift_ms']:.1f} ms ({report['drift_ppm']:.0f} ppm) "
+            f"timeouts={report['timeouts']}\n"
+            f"  fixed-rate model: underruns={model['underruns']} dropped={model['dropped']} "
+            f"peak_buffer={model['peak_buffer']}")
+
+
+def check_thresholds(reports, max_jitter_p99_ms=None, max_drift_ms=None,
+                     max_fixed_rate_underruns=None, max_gaps=None, max_timeouts=None):
+    """Return a list of human-readable threshold violations."""
+    failures = []
+    for r in reports:
+        name = f"[{r['path']}] {r['file']}"
+        if 'error' in r:
+            failures.append(f"{name}: {r['error']}")
+            continue
+        if 'jitter_ms' not in r:
+            failures.append(f"{name}: only {r['samples']} samples received")
+            continue
+        if max_jitter_p99_ms is not None and r['jitter_ms']['p99'] > max_jitter_p99_ms:
+            failures.append(f"{name}: jitter p99 {r['jitter_ms']['p99']:.3f} ms > {max_jitter_p99_ms} ms")
+        if max_drift_ms is not None and abs(r['drift_ms']) > max_drift_ms:
+            failures.append(f"{name}: drift {r['drift_ms']:.1f} ms > {max_drift_ms} ms")
+        underruns = r['fixed_rate_model']['underruns']
+        if max_fixed_rate_underruns is not None and underruns > max_fixed_rate_underruns:
+            failures.append(f"{name}: {underruns} fixed-rate model underruns > {max_fixed_rate_underruns}")
+        if max_gaps is not None and r['gaps'] > max_gaps:
+            failures.append(f"{name}: {r['gaps']} gaps > {max_gaps}")
+        if max_timeouts is not None and r['timeouts'] > max_timeouts:
+            failures.append(f"{name}: {r['timeouts']} device timeouts > {max_timeouts}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--paths', nargs='+', choices=('ws', 'sse'), default=['ws', 'sse'])
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='Seconds replayed per recording (<= 0 for the whole recording)')
+    parser.add_argument('--backend-url', help='Use a running backend instead of starting one')
+    parser.add_argument('--backend-port', type=int, default=BACKEND_PORT)
+    parser.add_argument('--device-port', type=int, default=DEVICE_PORT)
+    parser.add_argument('--json', help='Write the full report to this file')
+    parser.add_argument('--max-jitter-p99-ms', type=float)
+    parser.add_argument('--max-drift-ms', type=float)
+    parser.add_argument('--max-fixed-rate-underruns', type=int,
+                        help='Gate on the hypothetical fixed-rate consumer, not the real firmware')
+    parser.add_argument('--max-gaps', type=int)
+    parser.add_argument('--max-timeouts', type=int,
+                        help='Gaps over 1 s, where the firmware switches the motor off')
+    args = parser.parse_args(argv)
+
+    # app.py resolves data/ relative to the working directory
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+
+    duration = args.duration if args.duration > 0 else None
+    device = SimulatedHapticDevice(port=args.device_port)
+    device.start()
+    backend = None
+    if args.backend_url:
+        backend_url = args.backend_url.rstrip('/')
+    else:
+        backend = BackendServer(port=args.backend_port)
+        backend.start()
+        backend_url = backend.url
+
+    try:
+        reports = run_harness(backend_url, device, args.paths, duration)
+    finally:
+        if backend is not None:
+            backend.stop()
+        device.stop()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+        print(f"Report saved to {args.json}")
+
+    failures = check_thresholds(reports, args.max_jitter_p99_ms, args.max_drift_ms,
+                                args.max_fixed_rate_underruns, args.max_gaps, args.max_timeouts)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())